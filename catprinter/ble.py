@@ -85,30 +85,49 @@ def notification_receiver_factory(event):
 async def wait_for_printer_ready(event):
     logger.info("⏳ Done printing. Waiting for printer to be ready...")
     await event.wait()
-    logger.info("✅ Printer is ready, disconnecting...")
+    logger.info("✅ Printer is ready.")
 
 
-async def run_ble(data, device: Optional[str]):
-    try:
-        address = await get_device_address(device)
-    except RuntimeError as e:
-        logger.error(f"🛑 {e}")
-        return
+async def connect(device: Optional[str]) -> BleakClient:
+    '''Connects to the printer and returns the connected client, so it can be
+    reused for several print jobs. Raises RuntimeError if no printer is found.
+    '''
+    address = await get_device_address(device)
     logger.info(f"⏳ Connecting to {address}...")
-    async with BleakClient(address) as client:
-        logger.info(f"✅ Connected: {client.is_connected}; MTU: {client.mtu_size}")
-        chunk_size = client.mtu_size - 3
-        event = asyncio.Event()
+    client = BleakClient(address)
+    await client.connect()
+    logger.info(f"✅ Connected: {client.is_connected}; MTU: {client.mtu_size}")
+    return client
+
+
+class PrinterUnreachableError(RuntimeError):
+    '''Raised by print_data when the printer can't be reached before any data
+    is sent to it, so sending the data again can't print it twice.
+    '''
 
-        receive_notification = notification_receiver_factory(event)
 
+async def print_data(client: BleakClient, data):
+    chunk_size = client.mtu_size - 3
+    event = asyncio.Event()
+
+    receive_notification = notification_receiver_factory(event)
+
+    try:
         await client.start_notify(RX_CHARACTERISTIC_UUID, receive_notification)
+    except Exception as e:
+        raise PrinterUnreachableError(f"Unable to subscribe to printer notifications: {e}") from e
 
+    try:
         logger.info(
             f"⏳ Sending {len(data)} bytes of data in chunks of {chunk_size} bytes..."
         )
         for i, chunk in enumerate(chunkify(data, chunk_size)):
-            await client.write_gatt_char(TX_CHARACTERISTIC_UUID, chunk)
+            try:
+                await client.write_gatt_char(TX_CHARACTERISTIC_UUID, chunk)
+            except Exception as e:
+                if i == 0:
+                    raise PrinterUnreachableError(f"Unable to send data to the printer: {e}") from e
+                raise
             await asyncio.sleep(WAIT_AFTER_EACH_CHUNK_S)
 
         try:
@@ -116,4 +135,26 @@ async def run_ble(data, device: Optional[str]):
                 wait_for_printer_ready(event), timeout=WAIT_FOR_PRINTER_DONE_TIMEOUT
             )
         except asyncio.TimeoutError:
-            logger.error("🛑 Timed out while waiting for printer done event. Exiting.")
+            raise RuntimeError("Timed out while waiting for printer done event")
+    finally:
+        # Stop notifications so the connection can be used for the next job.
+        # This fails if the link dropped meanwhile, don't hide the real error.
+        with contextlib.suppress(Exception):
+            await client.stop_notify(RX_CHARACTERISTIC_UUID)
+
+
+async def run_ble(data, device: Optional[str]):
+    try:
+        address = await get_device_address(device)
+    except RuntimeError as e:
+        logger.error(f"🛑 {e}")
+        return
+    logger.info(f"⏳ Connecting to {address}...")
+    async with BleakClient(address) as client:
+        logger.info(f"✅ Connected: {client.is_connected}; MTU: {client.mtu_size}")
+        try:
+            await print_data(client, data)
+        except RuntimeError as e:
+            logger.error(f"🛑 {e}. Exiting.")
+            return
+        logger.info("⏳ Disconnecting...")
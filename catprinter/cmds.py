@@ -1,3 +1,5 @@
+import numpy as np
+
 
 PRINT_WIDTH = 384
 
@@ -127,32 +129,25 @@ def encode_run_length_repetition(n, val):
 
 
 def run_length_encode(img_row):
+    img_row = np.asarray(img_row)
+    if img_row.size == 0:
+        return []
+
+    # Find where each run of equal pixels starts, so we only loop over runs
+    # instead of individual pixels.
+    run_starts = np.flatnonzero(img_row[1:] != img_row[:-1]) + 1
+    run_starts = np.concatenate(([0], run_starts))
+    run_lengths = np.diff(np.append(run_starts, img_row.size))
+
     res = []
-    count = 0
-    last_val = -1
-    for val in img_row:
-        if val == last_val:
-            count += 1
-        else:
-            res.extend(encode_run_length_repetition(count, last_val))
-            count = 1
-        last_val = val
-    if count > 0:
-        res.extend(encode_run_length_repetition(count, last_val))
+    for count, val in zip(run_lengths.tolist(), img_row[run_starts].tolist()):
+        res.extend(encode_run_length_repetition(count, val))
     return res
 
 
 def byte_encode(img_row):
-    def bit_encode(chunk_start, bit_index):
-        return 1 << bit_index if img_row[chunk_start + bit_index] else 0
-
-    res = []
-    for chunk_start in range(0, len(img_row), 8):
-        byte = 0
-        for bit_index in range(8):
-            byte |= bit_encode(chunk_start, bit_index)
-        res.append(byte)
-    return res
+    # Pack 8 pixels per byte, with the first pixel in the least significant bit.
+    return np.packbits(img_row, bitorder='little').tolist()
 
 
 def cmd_print_row(img_row):
@@ -5,28 +5,45 @@ import numpy as np
 from catprinter import logger
 
 
+def _add_error(row, delta):
+    '''Adds delta to row (a float copy of an image row) the way the per-pixel
+    dithering did: clamp to 0..255, then truncate like the uint8 store.
+    '''
+    return np.floor(np.clip(row + delta, 0, 255))
+
+
 def floyd_steinberg_dither(img):
     '''Applies the Floyd-Steinberg dithering to img, in place.
     img is expected to be a 8-bit grayscale image.
 
     Algorithm borrowed from wikipedia.org/wiki/Floyd%E2%80%93Steinberg_dithering.
+
+    Each row is thresholded with plain Python ints, since the error pushed to
+    the right depends on the previous pixel. The error for the next row is then
+    added with numpy, in the same order the per-pixel version did, so the output
+    is identical.
     '''
     h, w = img.shape
-
-    def adjust_pixel(y, x, delta):
-        if y < 0 or y >= h or x < 0 or x >= w:
-            return
-        img[y][x] = min(255, max(0, img[y][x] + delta))
-
     for y in range(h):
+        row = img[y].tolist()
+        errs = [0] * w
         for x in range(w):
-            new_val = 255 if img[y][x] > 127 else 0
-            err = img[y][x] - new_val
-            img[y][x] = new_val
-            adjust_pixel(y, x + 1, err * 7/16)
-            adjust_pixel(y + 1, x - 1, err * 3/16)
-            adjust_pixel(y + 1, x, err * 5/16)
-            adjust_pixel(y + 1, x + 1, err * 1/16)
+            new_val = 255 if row[x] > 127 else 0
+            err = row[x] - new_val
+            row[x] = new_val
+            errs[x] = err
+            if x + 1 < w:
+                row[x + 1] = int(min(255, max(0, row[x + 1] + err * 7/16)))
+        img[y] = row
+        if y + 1 < h:
+            errs = np.array(errs)
+            below = img[y + 1].astype(float)
+            # Pixel x of the next row gets 1/16 of the error at x - 1, then 5/16
+            # of the one at x, then 3/16 of the one at x + 1.
+            below[1:] = _add_error(below[1:], errs[:-1] * 1/16)
+            below = _add_error(below, errs * 5/16)
+            below[:-1] = _add_error(below[:-1], errs[1:] * 3/16)
+            img[y + 1] = below
     return img
 
 def atkinson_dither(img):
@@ -35,25 +52,34 @@ def atkinson_dither(img):
     img is expected to be a 8-bit grayscale image.
 
     Algorithm from https://tannerhelland.com/2012/12/28/dithering-eleven-algorithms-source-code.html
+
+    Rows are processed like in floyd_steinberg_dither, the output is identical to
+    the per-pixel version.
     '''
     h, w = img.shape
-
-    def adjust_pixel(y, x, delta):
-        if y < 0 or y >= h or x < 0 or x >= w:
-            return
-        img[y][x] = min(255, max(0, img[y][x] + delta))
-
     for y in range(h):
+        row = img[y].tolist()
+        errs = [0] * w
         for x in range(w):
-            new_val = 255 if img[y][x] > 127 else 0
-            err = img[y][x] - new_val
-            img[y][x] = new_val
-            adjust_pixel(y, x + 1, err * 1/8)
-            adjust_pixel(y, x + 2, err * 1/8)
-            adjust_pixel(y + 1, x - 1, err * 1/8)
-            adjust_pixel(y + 1, x, err * 1/8)
-            adjust_pixel(y + 1, x + 1, err * 1/8)
-            adjust_pixel(y + 2, x, err * 1/8)
+            new_val = 255 if row[x] > 127 else 0
+            err = row[x] - new_val
+            row[x] = new_val
+            errs[x] = err
+            if x + 1 < w:
+                row[x + 1] = int(min(255, max(0, row[x + 1] + err / 8)))
+            if x + 2 < w:
+                row[x + 2] = int(min(255, max(0, row[x + 2] + err / 8)))
+        img[y] = row
+        deltas = np.array(errs) / 8
+        if y + 1 < h:
+            # Pixel x of the next row gets the error at x - 1, then x, then x + 1.
+            below = img[y + 1].astype(float)
+            below[1:] = _add_error(below[1:], deltas[:-1])
+            below = _add_error(below, deltas)
+            below[:-1] = _add_error(below[:-1], deltas[1:])
+            img[y + 1] = below
+        if y + 2 < h:
+            img[y + 2] = _add_error(img[y + 2].astype(float), deltas)
     return img
 
 
@@ -122,6 +148,15 @@ def read_img(
     img_binarization_algo,
 ):
     im = cv2.imread(filename, cv2.IMREAD_GRAYSCALE)
+    return process_img(im, print_width, img_binarization_algo)
+
+
+def process_img(
+    im,
+    print_width,
+    img_binarization_algo,
+):
+    '''Resizes and binarizes im, an 8-bit grayscale image already in memory.'''
     height = im.shape[0]
     width = im.shape[1]
     factor = print_width / width
@@ -1,14 +1,23 @@
 #!/usr/bin/env python
 import argparse
+import asyncio
+import functools
+import logging
 import sys
-import os
-import subprocess
-import tempfile
 
-def parse_args():
+import numpy as np
+
+from catprinter import logger
+from catprinter.cmds import PRINT_WIDTH, cmds_print_img
+from catprinter.ble import run_ble
+from catprinter.img import process_img, show_preview
+from print import configure_logger
+from text_to_image import text_to_image
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(
         description='Creates an image from text and sends it to the cat printer')
-    parser.add_argument('text', nargs='?', type=str, 
+    parser.add_argument('text', nargs='?', type=str,
                         help='Text to print. If not provided, reads from stdin')
     parser.add_argument('-f', '--font-size', type=int, default=24,
                         help='Font size to use (default: 24)')
@@ -24,59 +33,84 @@ def parse_args():
                         help='If set, displays the final image and asks for confirmation before printing')
     parser.add_argument('-d', '--device', type=str, default='',
                         help='The printer\'s BLE address or advertisement name')
-    parser.add_argument('-e', '--energy', type=str, 
+    parser.add_argument('-e', '--energy', type=lambda h: int(h.removeprefix("0x"), 16),
                         help='Thermal energy. Between 0x0000 (light) and 0xffff (darker, default)',
                         default='0xffff')
-    return parser.parse_args()
+    parser.add_argument('--save-intermediate', type=str, metavar='PATH',
+                        help='Also save the rendered text image to PATH for debugging '
+                             '(e.g. /tmp/catprinter-text.png)')
+    return parser.parse_args(argv)
+
+@functools.lru_cache(maxsize=64)
+def render_text(text, font_size, width, padding, img_binarization_algo):
+    """Render and binarize text, returning (PIL image, binarized image)
+    
+    Results are cached, so repeated messages (e.g. status pings sent to the
+    webhook server) skip rendering and dithering entirely.
+    """
+    img = text_to_image(
+        text,
+        font_size=font_size,
+        width=width,
+        padding=padding,
+        output_file=None
+    )
+
+    bin_img = process_img(
+        np.asarray(img),
+        PRINT_WIDTH,
+        img_binarization_algo,
+    )
+    # The cached array is shared between calls, make sure nobody modifies it
+    bin_img.flags.writeable = False
+    return img, bin_img
+
+def build_print_data(text, args):
+    """Render text in memory and return the BLE commands to print it"""
+    # Replace literal '\n' with actual newlines
+    text = text.replace('\\n', '\n')
+
+    img, bin_img = render_text(
+        text,
+        args.font_size,
+        args.width,
+        args.padding,
+        args.img_binarization_algo,
+    )
+    if args.save_intermediate:
+        img.save(args.save_intermediate, compress_level=0)
+        logger.info(f'ℹ️  Saved rendered text image to {args.save_intermediate}')
+
+    if args.show_preview:
+        show_preview(bin_img)
+
+    logger.info(f'✅ Rendered text: {bin_img.shape} (h, w) pixels')
+    data = cmds_print_img(bin_img, energy=args.energy)
+    logger.info(f'✅ Generated BLE commands: {len(data)} bytes')
+    return data
+
+def print_text(text, args):
+    """Render text and send it to the printer"""
+    data = build_print_data(text, args)
+    asyncio.run(run_ble(data, device=args.device))
 
 def main():
     args = parse_args()
-    
+    configure_logger(logging.DEBUG)
+
     # Get text from argument or stdin
     if args.text:
         text = args.text
     else:
         text = sys.stdin.read().strip()
-    
-    # Replace literal '\n' with actual newlines
-    text = text.replace('\\n', '\n')
-    
-    # Use temporary directory for image
-    output_file = '/tmp/catprinter-text.png'
-    
-    # Run text_to_image.py to create the image
-    text_to_image_cmd = [
-        'python', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'text_to_image.py'),
-        text,
-        '-f', str(args.font_size),
-        '-w', str(args.width),
-        '-p', str(args.padding),
-        '-o', output_file
-    ]
-    
-    # Run the text_to_image.py script
-    subprocess.run(text_to_image_cmd, check=True)
-    
-    # Now run print.py to print the image
-    print_cmd = [
-        'python', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'print.py'),
-        output_file,
-        '-b', args.img_binarization_algo,
-        '-e', args.energy,
-        '-l', 'debug'
-    ]
-    
-    # Add optional arguments if specified
-    if args.show_preview:
-        print_cmd.append('-s')
-    
-    if args.device:
-        print_cmd.extend(['-d', args.device])
-    
-    # Run the print.py script
-    subprocess.run(print_cmd, check=True)
-    
-    print(f"Text has been printed from image: {output_file}")
+
+    try:
+        print_text(text, args)
+    except RuntimeError as e:
+        logger.error(f'🛑 {e}')
+        return
+
+    print("Text has been printed")
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
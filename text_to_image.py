@@ -19,107 +19,133 @@ def parse_args():
                         help='Disable emoji-compatible font (default: emoji support is enabled)')
     return parser.parse_args()
 
+# Common font paths on macOS/Linux/Windows
+_FONT_OPTIONS = [
+    '/System/Library/Fonts/Helvetica.ttc',
+    '/System/Library/Fonts/SFNSText.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/TTF/DejaVuSans.ttf',
+    'C:\\Windows\\Fonts\\arial.ttf'
+]
+
+# OpenSansEmoji font in local fonts directory
+_LOCAL_EMOJI_FONT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts', 'OpenSansEmoji.ttf')
+
+# Font files are looked up once at import time instead of on every render
+_RESOLVED_FONT_PATH = next((p for p in _FONT_OPTIONS if os.path.exists(p)), None)
+_RESOLVED_EMOJI_PATH = _LOCAL_EMOJI_FONT if os.path.exists(_LOCAL_EMOJI_FONT) else None
+
+# Loaded fonts keyed by (font_path, font_size, use_emoji)
+_FONT_CACHE = {}
+
+# Reused for measuring text, so renders don't allocate a throwaway image
+_MEASURE_DRAW = ImageDraw.Draw(Image.new('L', (1, 1), color=255))
+
+def _get_font(font_size, use_emoji=True):
+    """Return the font to render with, loading each font file only once"""
+    font_path, emoji_font_path = _RESOLVED_FONT_PATH, _RESOLVED_EMOJI_PATH
+    use_emoji = bool(use_emoji and emoji_font_path)
+    
+    key = (emoji_font_path if use_emoji else font_path, font_size, use_emoji)
+    if key in _FONT_CACHE:
+        return _FONT_CACHE[key]
+    
+    # Choose the appropriate font
+    if use_emoji:
+        print(f"Using emoji font: {emoji_font_path}")
+        font = ImageFont.truetype(emoji_font_path, font_size)
+    elif font_path:
+        font = ImageFont.truetype(font_path, font_size)
+    else:
+        # Use a default font if none of the above exist
+        font = ImageFont.load_default()
+    
+    _FONT_CACHE[key] = font
+    return font
+
 def text_to_image(text, font_size=24, width=384, padding=20, output_file='text.png', use_emoji=True):
     """
-    Creates an image with black text on white background
+    Creates a grayscale image with black text on white background
     
     Args:
         text: The text to render
         font_size: Font size to use
         width: Width of the image in pixels
         padding: Padding around text in pixels
-        output_file: Path to save the output image
+        output_file: Path to save the output image. If None, the image is
+            not saved and the PIL Image is returned instead
         use_emoji: Whether to use emoji-compatible font
     
     Returns:
-        Path to the created image file
+        Path to the created image file, or the PIL Image if output_file is None
     """
-    # Try to find a font on the system
-    font_path = None
-    emoji_font_path = None
-    
-    # Check for OpenSansEmoji font in local fonts directory
-    local_emoji_font = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts', 'OpenSansEmoji.ttf')
-    if os.path.exists(local_emoji_font):
-        emoji_font_path = local_emoji_font
-    
-    # Common font paths
-    font_options = [
-        # Common font paths on macOS/Linux/Windows
-        '/System/Library/Fonts/Helvetica.ttc',
-        '/System/Library/Fonts/SFNSText.ttf',
-        '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
-        '/usr/share/fonts/TTF/DejaVuSans.ttf',
-        'C:\\Windows\\Fonts\\arial.ttf'
-    ]
-    
-    for path in font_options:
-        if os.path.exists(path):
-            font_path = path
-            break
-    
-    # Choose the appropriate font
-    if use_emoji and emoji_font_path:
-        print(f"Using emoji font: {emoji_font_path}")
-        font = ImageFont.truetype(emoji_font_path, font_size)
-    elif font_path:
-        font = ImageFont.truetype(font_path, font_size)
-    else:
-        # Use a default font if none of the above exist
-        font = ImageFont.load_default()
+    font = _get_font(font_size, use_emoji)
     
     # Split text into lines to handle wrapping
     # First split by explicit newlines in the text
     paragraphs = text.split('\n')
     lines = []
     
-    temp_img = Image.new('RGB', (1, 1), color='white')
-    temp_draw = ImageDraw.Draw(temp_img)
+    # Measure the space once, words are measured once each and line widths
+    # are accumulated instead of re-measuring the whole line for every word
+    space_width = font.getlength(' ')
+    max_width = width - (padding * 2)
     
     # Process each paragraph
     for paragraph in paragraphs:
         words = paragraph.split()
         current_line = []
+        line_width = 0
         
         # If paragraph is empty, add an empty line
         if not words:
             lines.append("")
             continue
+        
+        word_widths = [font.getlength(word) for word in words]
+        
+        for word, word_width in zip(words, word_widths):
+            if current_line and line_width + space_width + word_width > max_width:
+                lines.append(' '.join(current_line))
+                current_line = []
             
-        for word in words:
-            test_line = ' '.join(current_line + [word])
-            line_width = temp_draw.textlength(test_line, font=font)
-            
-            if line_width <= (width - (padding * 2)):
+            if current_line:
                 current_line.append(word)
+                line_width += space_width + word_width
             else:
-                if current_line:
-                    lines.append(' '.join(current_line))
-                    current_line = [word]
-                else:
-                    # Word is too long for the line, but we'll add it anyway
-                    # and it will get cut off or wrapped
-                    lines.append(word)
+                # A word too long for the line still gets a line of its own
+                # and will get cut off
+                current_line = [word]
+                line_width = word_width
         
         if current_line:
             lines.append(' '.join(current_line))
     
-    # Calculate height based on number of lines and font size
-    line_height = font_size + 4  # Add a little extra space between lines
-    height = (len(lines) * line_height) + (padding * 2)
+    text_block = '\n'.join(lines)
+    line_spacing = 4  # Add a little extra space between lines
+    
+    # Calculate height from the exact bounding box of the laid out text.
+    # Empty lines are measured as a capital letter, so trailing blank lines
+    # still take a full line of paper instead of only the spacing above them.
+    measured_block = '\n'.join(line or 'A' for line in lines)
+    text_bbox = _MEASURE_DRAW.multiline_textbbox((padding, padding), measured_block, font=font,
+                                                 spacing=line_spacing)
+    height = text_bbox[3] + padding
     
-    # Create the actual image
-    img = Image.new('RGB', (width, height), color='white')
+    # Create the actual image. It is rendered in grayscale since the printer
+    # only prints black and white, RGB would just triple the pixel data
+    img = Image.new('L', (width, height), color=255)
     draw = ImageDraw.Draw(img)
     
-    # Draw text line by line
-    y_pos = padding
-    for line in lines:
-        draw.text((padding, y_pos), line, font=font, fill='black')
-        y_pos += line_height
+    # Draw all lines in a single layout pass
+    draw.multiline_text((padding, padding), text_block, font=font, fill=0, spacing=line_spacing)
+    
+    if output_file is None:
+        return img
     
-    # Save the image
-    img.save(output_file)
+    # Save the image. It's small and only read back for printing, so skip
+    # the PNG compression which would otherwise dominate the save time
+    img.save(output_file, compress_level=0)
     
     return output_file
 
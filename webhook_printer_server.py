@@ -2,18 +2,48 @@
 import os
 import sys
 import requests
+from requests.adapters import HTTPAdapter
 import time
-import json
-import subprocess
 import argparse
+import asyncio
+import contextlib
+import functools
+import importlib
+import logging
+import multiprocessing
+import queue
+import signal
 from datetime import datetime, timedelta, timezone
 
+# Use orjson to parse request bodies if it's installed, it's a lot faster
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+logger = logging.getLogger('webhook_printer_server')
+
+# datetime.fromisoformat() accepts a 'Z' suffix natively since Python 3.11
+FROMISOFORMAT_ACCEPTS_Z = sys.version_info >= (3, 11)
+
+# Number of requests fetched from webhook.site per page, and the most pages fetched per poll
+API_PAGE_SIZE = 50
+MAX_PAGES_PER_POLL = 20
+
+# The check interval is doubled at most this many times while idle
+MAX_BACKOFF_STEPS = 6
+
+# Seconds without messages after which the print worker disconnects from the printer
+PRINTER_IDLE_TIMEOUT = 120
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Server that listens for webhook events and prints messages')
     parser.add_argument('--webhook-url', type=str, required=True,
                        help='Your webhook URL from webhook.site')
     parser.add_argument('--check-interval', type=int, default=10,
                        help='How often to check for new messages in seconds (default: 10)')
+    parser.add_argument('--max-interval', type=int, default=60,
+                       help='Longest wait between checks in seconds when no messages arrive (default: 60)')
     parser.add_argument('--timestamp-file', type=str, default='.webhook_timestamp',
                        help='File to store the timestamp of the last processed message')
     parser.add_argument('--print-args', type=str, default='',
@@ -28,15 +58,24 @@ def parse_args():
                        help='Do not truncate messages regardless of length')
     return parser.parse_args()
 
+def parse_iso_timestamp(timestamp_str):
+    """Parse an ISO format timestamp, which may end with 'Z', into a UTC datetime object"""
+    if not FROMISOFORMAT_ACCEPTS_Z:
+        timestamp_str = timestamp_str.replace('Z', '+00:00')
+    dt = datetime.fromisoformat(timestamp_str)
+    if dt.tzinfo is timezone.utc:
+        return dt
+    return dt.astimezone(timezone.utc)
+
 def get_last_timestamp(timestamp_file):
     """Get the timestamp of the last processed message"""
     if os.path.exists(timestamp_file):
         try:
             with open(timestamp_file, 'r') as f:
                 timestamp_str = f.read().strip()
-                return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00')).astimezone(timezone.utc)
+                return parse_iso_timestamp(timestamp_str)
         except Exception as e:
-            print(f"Error reading timestamp file: {e}")
+            logger.error("Error reading timestamp file: %s", e)
     return None
 
 def save_timestamp(timestamp_file, timestamp):
@@ -49,120 +88,264 @@ def save_timestamp(timestamp_file, timestamp):
         else:
             f.write(str(timestamp))
 
-def print_message(message, print_args='', max_length=255):
-    """Print a message using print-text.py with length limit"""
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    print_script = os.path.join(script_dir, 'print-text.py')
+def parse_print_args(print_args=''):
+    """Parse --print-args with print-text.py's own parser, exiting if they are invalid"""
+    print_text = importlib.import_module('print-text')
+    try:
+        args = print_text.parse_args(print_args.split())
+    except SystemExit:
+        logger.error("Invalid --print-args: %r", print_args)
+        raise
+    
+    if args.show_preview:
+        # The print worker has no terminal to ask for confirmation on
+        logger.warning("Ignoring --show-preview in --print-args, previews need an interactive terminal")
+        args.show_preview = False
+    return args
+
+def print_worker(jobs, print_args, log_level=logging.INFO):
+    """Print messages from the jobs queue until a None sentinel is received
     
+    Runs in a long-lived child process so the interpreter, PIL and the BLE
+    stack are only loaded once instead of once per message.
+    
+    Ctrl-C is ignored here, the server stops the worker with the sentinel
+    once the queued messages have been printed.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    print_text = importlib.import_module('print-text')
+    
+    configure_logging(log_level)
+    asyncio.run(print_jobs(jobs, print_args, print_text))
+
+async def disconnect_printer(client):
+    """Disconnect from the printer, ignoring errors from an already broken link"""
+    if client is not None and client.is_connected:
+        with contextlib.suppress(Exception):
+            await client.disconnect()
+
+async def print_jobs(jobs, args, print_text):
+    """Print queued messages, keeping the printer connected between them
+    
+    The printer is connected to right away, so a missing printer is reported
+    at startup. The connection is dropped after PRINTER_IDLE_TIMEOUT seconds
+    without messages and re-established when the next one arrives.
+    """
+    from catprinter.ble import PrinterUnreachableError, connect, print_data
+    
+    loop = asyncio.get_running_loop()
+    client = None
+    try:
+        try:
+            client = await connect(args.device)
+        except Exception as e:
+            logger.error("Unable to connect to the printer: %s. Retrying when a message arrives", e)
+        
+        while True:
+            try:
+                message = await loop.run_in_executor(None, jobs.get, True, PRINTER_IDLE_TIMEOUT)
+            except queue.Empty:
+                if client is not None and client.is_connected:
+                    logger.info("No messages for a while, disconnecting from the printer")
+                    await disconnect_printer(client)
+                client = None
+                continue
+            
+            if message is None:
+                break
+            
+            try:
+                data = print_text.build_print_data(message, args)
+                
+                reused = client is not None and client.is_connected
+                if not reused:
+                    client = await connect(args.device)
+                try:
+                    await print_data(client, data)
+                except PrinterUnreachableError:
+                    await disconnect_printer(client)
+                    client = None
+                    if not reused:
+                        raise
+                    # Nothing was sent over the stale idle connection, so it's
+                    # safe to reconnect and send the message again
+                    logger.info("Printer connection was lost, reconnecting")
+                    client = await connect(args.device)
+                    await print_data(client, data)
+                except Exception:
+                    # The data may already have been printed, so it's not sent
+                    # again, but the connection can't be trusted anymore
+                    await disconnect_printer(client)
+                    client = None
+                    raise
+                
+                logger.info("Message printed successfully")
+            except Exception as e:
+                logger.error("Error printing: %s", e)
+    finally:
+        await disconnect_printer(client)
+
+def start_print_worker(jobs, print_args, log_level=logging.INFO):
+    """Start the print worker process, print_args are the parsed print-text.py arguments"""
+    worker = multiprocessing.Process(target=print_worker, args=(jobs, print_args, log_level), daemon=True)
+    worker.start()
+    return worker
+
+def print_message(jobs, message, max_length=255):
+    """Queue a message for the print worker with length limit"""
     # Truncate message if needed
     if max_length > 0 and len(message) > max_length:
         truncated_message = message[:max_length - 3] + '...'
-        print(f"Message truncated from {len(message)} to {len(truncated_message)} characters")
+        logger.info("Message truncated from %d to %d characters", len(message), len(truncated_message))
         message_to_print = truncated_message
     else:
         message_to_print = message
     
-    cmd = [sys.executable, print_script]
-    if print_args:
-        cmd.extend(print_args.split())
-    cmd.append(message_to_print)
-    
-    print(f"Running: {' '.join(cmd)}")
-    subprocess.run(cmd, check=True)
+    jobs.put(message_to_print)
 
 def extract_token_from_url(url):
     """Extract the token from the webhook URL"""
     return url.strip('/').split('/')[-1]
 
-def is_valid_post_json_message(request, debug=False):
-    """Check if the request is a valid POST with a 'message' in the JSON body"""
+def parse_request(request):
+    """Return the message of a POST request with a 'message' in the JSON body, or None
+    
+    The parsed body is cached on the request so it is only parsed once.
+    """
     # Check if it's a POST request
     if request.get('method', '').upper() != 'POST':
-        return False
-    
-    # Check for JSON body with message field
-    body = request.get('content', request.get('body', ''))
-    if not body:
-        return False
+        return None
     
-    try:
-        # Parse body as JSON
-        if isinstance(body, str):
-            body_data = json.loads(body)
-        else:
-            body_data = body  # Already parsed
+    if '_parsed' in request:
+        body_data = request['_parsed']
+    else:
+        # Check for JSON body with message field
+        body = request.get('content', request.get('body', ''))
+        if not body:
+            return None
         
-        # Check for message field
-        return isinstance(body_data, dict) and 'message' in body_data
-    except:
-        return False
+        try:
+            # Parse body as JSON
+            if isinstance(body, str):
+                body_data = json_loads(body)
+            else:
+                body_data = body  # Already parsed
+        except (ValueError, RecursionError):
+            return None
+        request['_parsed'] = body_data
+    
+    # Check for a string message field
+    if not isinstance(body_data, dict) or not isinstance(body_data.get('message'), str):
+        return None
+    return body_data['message']
 
-def extract_message(request):
-    """Extract message from a request"""
-    try:
-        body = request.get('content', request.get('body', ''))
-        if isinstance(body, str):
-            body_data = json.loads(body)
+@functools.lru_cache(maxsize=64)
+def _parse_utc_timestamp(timestamp_str):
+    """Parse a timestamp string into a UTC datetime object, raising ValueError if invalid"""
+    s = timestamp_str
+    if len(s) == 19 and s[10] == ' ' and s[4] == s[7] == '-' and s[13] == s[16] == ':':
+        # webhook.site format: "YYYY-MM-DD HH:MM:SS" - no timezone info but is UTC.
+        # This is by far the most common format, parse it by hand as strptime is slow.
+        return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                        int(s[11:13]), int(s[14:16]), int(s[17:19]), tzinfo=timezone.utc)
+    
+    # Handle formats with and without timezone info
+    if 'T' in s:
+        # ISO format
+        if s.endswith('Z'):
+            # Already has UTC indicator
+            return parse_iso_timestamp(s)
+        elif '+' in s or '-' in s and s.rindex('-') > 10:
+            # Has timezone info
+            return parse_iso_timestamp(s)
         else:
-            body_data = body
-        return body_data.get('message', '')
-    except:
-        return None
+            # No timezone info, assume UTC
+            dt = datetime.fromisoformat(s).replace(tzinfo=timezone.utc)
+    else:
+        dt = datetime.strptime(s, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    
+    # Ensure result is in UTC
+    if dt.tzinfo is timezone.utc:
+        return dt
+    return dt.astimezone(timezone.utc)
 
-def parse_webhook_timestamp(timestamp_str, debug=False):
+def parse_webhook_timestamp(timestamp_str):
     """Parse a timestamp string into a UTC datetime object
     
     webhook.site timestamps are in UTC but don't include timezone info.
     We need to explicitly set the timezone to UTC.
     """
-    if debug:
-        print(f"Parsing timestamp: {timestamp_str}")
+    logger.debug("Parsing timestamp: %s", timestamp_str)
     
     try:
-        # Handle formats with and without timezone info
-        if 'T' in timestamp_str:
-            # ISO format
-            if timestamp_str.endswith('Z'):
-                # Already has UTC indicator
-                dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-            elif '+' in timestamp_str or '-' in timestamp_str and timestamp_str.rindex('-') > 10:
-                # Has timezone info
-                dt = datetime.fromisoformat(timestamp_str)
-            else:
-                # No timezone info, assume UTC
-                dt = datetime.fromisoformat(timestamp_str).replace(tzinfo=timezone.utc)
-        else:
-            # webhook.site format: "YYYY-MM-DD HH:MM:SS" - no timezone info but is UTC
-            dt = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
-        
-        # Ensure result is in UTC
-        dt_utc = dt.astimezone(timezone.utc)
-        
-        if debug:
-            print(f"Parsed to UTC: {dt_utc.isoformat()}")
-        
+        dt_utc = _parse_utc_timestamp(timestamp_str)
+        logger.debug("Parsed to UTC: %s", dt_utc)
         return dt_utc
         
     except Exception as e:
-        if debug:
-            print(f"Error parsing timestamp '{timestamp_str}': {e}")
+        logger.debug("Error parsing timestamp '%s': %s", timestamp_str, e)
         # Return a default timestamp far in the past
         return datetime(2000, 1, 1, tzinfo=timezone.utc)
 
+def fetch_new_requests(session, api_url, since, etag=None):
+    """Fetch the requests created since the given time, oldest first
+    
+    Pages are followed, so a burst of more than API_PAGE_SIZE requests (e.g.
+    after downtime) is not cut short. Returns (requests, etag), requests is
+    None if the first page didn't change since the response with that ETag.
+    """
+    requests_list = []
+    for page in range(1, MAX_PAGES_PER_POLL + 1):
+        params = {
+            'sorting': 'oldest',
+            'per_page': API_PAGE_SIZE,
+            'page': page,
+            'date_from': since.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        request_headers = {'If-None-Match': etag} if etag and page == 1 else {}
+        response = session.get(api_url, params=params, headers=request_headers)
+        if page == 1 and response.status_code == 304:
+            return None, etag
+        response.raise_for_status()
+        if page == 1:
+            etag = response.headers.get('ETag')
+        data = response.json()
+        
+        logger.debug("API request to: %s", response.url)
+        logger.debug("Response status: %d", response.status_code)
+        
+        # Extract request list
+        page_requests = data.get('data', []) if isinstance(data, dict) else data
+        requests_list.extend(page_requests)
+        if len(page_requests) < API_PAGE_SIZE or isinstance(data, dict) and data.get('is_last_page'):
+            break
+    return requests_list, etag
+
+def configure_logging(log_level):
+    """Log plain messages to stdout, including the catprinter logs of the print worker"""
+    logging.basicConfig(level=log_level, format='%(message)s', stream=sys.stdout)
+
 def main():
     args = parse_args()
     
-    print(f"Starting webhook printer server...")
-    print(f"URL: {args.webhook_url}")
-    print(f"Check interval: {args.check_interval} seconds")
-    print(f"Only processing POST requests with JSON message payloads")
+    log_level = logging.DEBUG if args.debug else logging.INFO
+    configure_logging(log_level)
+    
+    # Fail at startup on invalid print arguments rather than in the print worker
+    print_args = parse_print_args(args.print_args)
+    
+    logger.info("Starting webhook printer server...")
+    logger.info("URL: %s", args.webhook_url)
+    max_interval = max(args.max_interval, args.check_interval)
+    logger.info("Check interval: %d seconds (up to %d seconds when idle)", args.check_interval, max_interval)
+    logger.info("Only processing POST requests with JSON message payloads")
     
     # Get max message length
     max_length = 0 if args.no_truncate else args.max_length
     if max_length > 0:
-        print(f"Messages will be truncated to {max_length} characters for printing")
+        logger.info("Messages will be truncated to %d characters for printing", max_length)
     else:
-        print("Message length will not be limited")
+        logger.info("Message length will not be limited")
     
     # Extract token and set up API URL
     token = extract_token_from_url(args.webhook_url)
@@ -172,10 +355,10 @@ def main():
     last_timestamp = None
     if args.start_from:
         try:
-            last_timestamp = parse_webhook_timestamp(args.start_from, args.debug)
-            print(f"Starting from provided time: {last_timestamp.isoformat()}")
+            last_timestamp = parse_webhook_timestamp(args.start_from)
+            logger.info("Starting from provided time: %s", last_timestamp.isoformat())
         except Exception as e:
-            print(f"Error parsing start time: {e}")
+            logger.error("Error parsing start time: %s", e)
     
     if last_timestamp is None:
         last_timestamp = get_last_timestamp(args.timestamp_file)
@@ -183,37 +366,53 @@ def main():
     if last_timestamp is None:
         # Start from current time minus 1 minute
         last_timestamp = datetime.now(timezone.utc) - timedelta(minutes=1)
-        print(f"Starting from current time: {last_timestamp.isoformat()}")
+        logger.info("Starting from current time: %s", last_timestamp.isoformat())
     else:
-        print(f"Resuming from: {last_timestamp.isoformat()}")
+        logger.info("Resuming from: %s", last_timestamp.isoformat())
+    
+    # Start the print worker once, it is reused for every message
+    jobs = multiprocessing.Queue()
+    worker = start_print_worker(jobs, print_args, log_level)
     
     headers = {
         "Accept": "application/json",
         "Content-Type": "application/json"
     }
     
+    # Reuse a single keep-alive connection so the TLS handshake is only paid once
+    session = requests.Session()
+    session.headers.update(headers)
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+    etag = None
+    
+    # webhook.site timestamps only have second precision, so requests created
+    # in the same second as last_timestamp are told apart by their UUIDs.
+    # None means all of them were processed, which is assumed on startup.
+    processed_ids = None
+    idle_polls = 0
+    
     try:
         while True:
+            # Back off exponentially while idle, new messages reset the interval
+            poll_interval = min(max_interval, args.check_interval * 2 ** min(idle_polls, MAX_BACKOFF_STEPS))
+            idle_polls += 1
+            
             try:
-                # Fetch new webhook data
-                response = requests.get(api_url, headers=headers)
-                response.raise_for_status()
-                data = response.json()
-                
-                if args.debug:
-                    print(f"API request to: {api_url}")
-                    print(f"Response status: {response.status_code}")
+                # Fetch new webhook data, letting webhook.site filter out old requests
+                requests_list, etag = fetch_new_requests(session, api_url, last_timestamp, etag)
+                if requests_list is None:
+                    logger.debug("No changes since last check")
+                    time.sleep(poll_interval)
+                    continue
                 
-                # Extract request list
-                requests_list = data.get('data', data if isinstance(data, list) else [])
                 if not requests_list:
-                    if args.debug:
-                        print("No requests found")
-                    time.sleep(args.check_interval)
+                    logger.debug("No requests found")
+                    time.sleep(poll_interval)
                     continue
                 
-                # Track the most recent timestamp
+                # Track the most recent timestamp and the requests processed in its second
                 most_recent_timestamp = last_timestamp
+                most_recent_ids = set(processed_ids) if processed_ids is not None else None
                 
                 # Process new requests
                 for req in requests_list:
@@ -225,63 +424,77 @@ def main():
                     if not created_at_str:
                         continue
                     
-                    if args.debug:
-                        print(f"Request timestamp from API: {created_at_str}")
+                    logger.debug("Request timestamp from API: %s", created_at_str)
                     
-                    created_at = parse_webhook_timestamp(created_at_str, args.debug)
+                    created_at = parse_webhook_timestamp(created_at_str)
                     
                     # Skip if already processed
-                    if created_at <= last_timestamp:
-                        if args.debug:
-                            print(f"Skipping request from {created_at.isoformat()}")
-                            print(f"  Last processed: {last_timestamp.isoformat()}")
-                            print(f"  Comparison: {created_at.timestamp()} <= {last_timestamp.timestamp()}")
+                    request_id = req.get('uuid')
+                    if created_at < last_timestamp or created_at == last_timestamp and (
+                            processed_ids is None or request_id in processed_ids):
+                        logger.debug("Skipping request from %s", created_at)
+                        logger.debug("  Last processed: %s", last_timestamp)
                         continue
                     
                     # Update most recent timestamp
                     if created_at > most_recent_timestamp:
                         most_recent_timestamp = created_at
+                        most_recent_ids = {request_id}
+                    elif created_at == most_recent_timestamp:
+                        most_recent_ids.add(request_id)
                     
-                    # Check if valid POST with JSON message
-                    if not is_valid_post_json_message(req, args.debug):
-                        if args.debug:
-                            print(f"Skipping invalid request type")
+                    # Check if valid POST with JSON message and extract it
+                    message = parse_request(req)
+                    if message is None:
+                        logger.debug("Skipping invalid request type")
                         continue
                     
-                    # Extract and print message
-                    message = extract_message(req)
+                    # Print message
                     if message:
                         # Log the full message regardless of length
-                        print(f"\n[{created_at.isoformat()}] New message ({len(message)} chars):")
-                        print(message)
+                        logger.info("\n[%s] New message (%d chars):\n%s",
+                                    created_at.isoformat(), len(message), message)
                         
-                        try:
-                            # Print with potential length limit
-                            print_message(message, args.print_args, max_length)
-                            print("Message printed successfully")
-                        except Exception as e:
-                            print(f"Error printing: {e}")
+                        # Restart the print worker if it died
+                        if not worker.is_alive():
+                            logger.warning("Print worker is not running, restarting it")
+                            worker = start_print_worker(jobs, print_args, log_level)
+                        
+                        # Print with potential length limit
+                        print_message(jobs, message, max_length)
+                        
+                        # Poll quickly again, more messages may follow
+                        idle_polls = 0
+                        poll_interval = args.check_interval
                 
                 # Update timestamp if newer messages were processed
+                processed_ids = most_recent_ids
                 if most_recent_timestamp > last_timestamp:
                     last_timestamp = most_recent_timestamp
                     save_timestamp(args.timestamp_file, last_timestamp)
-                    if args.debug:
-                        print(f"Updated timestamp to: {last_timestamp.isoformat()}")
+                    logger.debug("Updated timestamp to: %s", last_timestamp)
                 
             except requests.RequestException as e:
-                print(f"API error: {e}")
+                logger.error("API error: %s", e)
             except Exception as e:
-                print(f"Unexpected error: {e}")
-                if args.debug:
-                    import traceback
-                    traceback.print_exc()
+                logger.error("Unexpected error: %s", e, exc_info=args.debug)
             
             # Wait before next check
-            time.sleep(args.check_interval)
+            time.sleep(poll_interval)
     
     except KeyboardInterrupt:
-        print("\nServer stopped by user")
+        logger.info("\nServer stopped by user")
+        session.close()
+        
+        # Their timestamps are already saved, so let the worker print the
+        # queued messages before exiting
+        jobs.put(None)
+        if worker.is_alive():
+            logger.info("Waiting for queued messages to be printed, press Ctrl-C again to abort")
+            try:
+                worker.join()
+            except KeyboardInterrupt:
+                logger.warning("Aborted, queued messages were not printed")
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file